@@ -1,14 +1,111 @@
-from gurobipy import Model, GRB, quicksum
+from gurobipy import Model, GRB, Column
+import scipy.sparse as sp
 from utils import *
-from typing import List, Dict
+from typing import List
+
+
+def build_covering_matrix(masks: np.ndarray, n_deliveries: int) -> sp.csr_matrix:
+    """
+    Build the 0/1 covering matrix A (deliveries x trips) from the trip masks:
+    A[k, i] = 1 when bit k of masks[i] is set, i.e. trip i covers delivery k.
+    """
+    rows, cols = [], []
+    for k in range(n_deliveries):
+        cover_by_bit = np.flatnonzero(masks & np.uint64(1 << k))
+        rows.append(np.full(len(cover_by_bit), k))
+        cols.append(cover_by_bit)
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=int)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=int)
+    return sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_deliveries, len(masks)))
+
+
+def generate_columns(A: sp.csr_matrix,
+                     scores: np.ndarray,
+                     initial: np.ndarray,
+                     threads: int = 0,
+                     method: int = -1,
+                     max_rounds: int = 100) -> np.ndarray:
+    """
+    Column generation over the enumerated trips.
+    Starting from the `initial` trip indices, solve the LP relaxation of the covering
+    problem restricted to the current columns, price every trip with the duals of the
+    covering rows (reduced cost = score - sum of duals of covered deliveries) and add
+    the trips with negative reduced cost, until none is left or `max_rounds` is hit.
+    The restricted master is built once: new trips are added to it as columns of the
+    covering rows and the LP is re-optimized from the previous basis.
+
+    Returns the sorted indices of the trips in the final restricted master. If the
+    restricted master is infeasible (a delivery not covered by the initial columns),
+    all trips are returned.
+    """
+    in_master = np.zeros(A.shape[1], dtype=bool)
+    in_master[initial] = True
+    columns = np.flatnonzero(in_master)
+    A_csc = A.tocsc()
+
+    lp = Model("TripSelectionMaster")
+    lp.setParam("OutputFlag", 0)
+    lp.setParam("Threads", threads)
+    lp.setParam("Method", method)
+    lp.ModelSense = GRB.MINIMIZE
+    y = lp.addMVar(len(columns), lb=0.0, obj=scores[columns])
+    cover = lp.addMConstr(A[:, columns], y, "=", np.ones(A.shape[0]))
+    cover_rows = cover.tolist()
+    for _ in range(max_rounds):
+        lp.optimize()
+        if lp.Status != GRB.OPTIMAL:
+            lp.dispose()
+            return np.arange(A.shape[1])
+        reduced_costs = scores - A.T @ cover.Pi
+
+        new = np.flatnonzero((reduced_costs < -1e-9) & ~in_master)
+        if len(new) == 0:
+            break
+        for j in new:
+            start, end = A_csc.indptr[j], A_csc.indptr[j + 1]
+            lp.addVar(lb=0.0, obj=scores[j],
+                      column=Column(A_csc.data[start:end].tolist(),
+                                    [cover_rows[k] for k in A_csc.indices[start:end]]))
+        in_master[new] = True
+    lp.dispose()
+    return np.flatnonzero(in_master)
+
+
+def greedy_cover(masks: np.ndarray, scores: np.ndarray, n_deliveries: int):
+    """
+    Greedy heuristic for the covering problem: repeatedly pick the trip with the lowest
+    score per newly covered delivery. Only trips disjoint from the deliveries already
+    covered are considered, since every delivery must be covered exactly once.
+
+    Returns the list of chosen trip indices, or None if the greedy gets stuck.
+    """
+    sizes = np.array([int(m).bit_count() for m in masks], dtype=float)
+    full_mask = np.uint64((1 << n_deliveries) - 1)
+    covered = np.uint64(0)
+    chosen = []
+    while covered != full_mask:
+        candidates = (masks & covered) == 0
+        if not candidates.any():
+            return None
+        cost = np.where(candidates, scores / sizes, np.inf)
+        i = int(np.argmin(cost))
+        chosen.append(i)
+        covered |= masks[i]
+    return chosen
+
 
 def solve_set_covering(LOGDIR: str,
                                      i_name: str,
-                                     trips: List[Dict],
+                                     trips: List[Trip],
                                      deliveries: List[Delivery],
                                      pool_solutions: int = 100,
                                      pool_gap: float = None,
-                                     time_limit: int = 3600):
+                                     time_limit: int = 3600,
+                                     threads: int = 0,
+                                     presolve: int = 1,
+                                     mip_focus: int = 1,
+                                     method: int = -1,
+                                     column_generation: bool = False):
     """
     Solve the set-covering MIP and return ALL solutions stored in Gurobi's solution pool.
 
@@ -16,20 +113,40 @@ def solve_set_covering(LOGDIR: str,
         solutions: list of dicts, one per solution found/stored. Each dict contains:
             - 'obj': objective value (PoolObjVal for that solution)
             - 'selected_trip_indices': list of trip indices selected in this solution
-            - 'selected_trips': list of trip dicts (from input trips)
+            - 'selected_trips': list of Trip tuples (from input trips)
             - 'total_km', 'total_weight', 'total_volume', 'score' aggregated for the solution
             - 'solution_number': solution index in the pool (0..SolCount-1)
     Notes:
+        - Each trip must carry the mask produced by generate_feasible_trips, where
+          bit k stands for deliveries[k]; the same deliveries list must be passed here.
         - We set PoolSearchMode and PoolSolutions to ask Gurobi to keep multiple solutions.
         - Optionally set PoolGap (e.g. 0.05 for within 5% of best) to restrict stored suboptimal solutions.
+        - `threads` is forwarded to Gurobi's Threads parameter (0 = let Gurobi decide). On small and
+          medium models fewer threads are often faster; run a short sweep (1, 2, 4, 8) once per
+          problem class and keep the best value.
+        - `presolve`, `mip_focus` and `method` are forwarded to Presolve, MIPFocus and Method.
+          Conservative presolve (1) is usually enough for the covering matrix, and MIPFocus=1
+          favours finding feasible solutions early, which is what fills the pool. Symmetry
+          detection is set to aggressive since equivalent trips make the model highly symmetric.
+        - With `column_generation`, the MIP only gets the trips generated by pricing over the
+          LP relaxation (see generate_columns), starting from the single-delivery trips. This
+          shrinks the MIP on large trip sets but is a heuristic: the optimum and the pool may
+          differ from the full model. 'selected_trip_indices' always index the input `trips`.
+        - The search is warm-started with a greedy solution (see greedy_cover) when one exists.
         - See Gurobi docs (Solution Pool and Xn attribute) for details. :contentReference[oaicite:2]{index=2}
     """
     # --- Model setup ---------------------------------------------------------
+    log_path = os.path.join(LOGDIR, f"{i_name}.log")
     model = Model("TripSelection")
     model.setParam("OutputFlag", 1)
-    model.setParam("LogFile", os.path.join(LOGDIR, f"{i_name}.log"))
+    model.setParam("LogFile", log_path)
     model.setParam("TimeLimit", time_limit)
     model.setParam("Seed", 12345)
+    model.setParam("Threads", threads)
+    model.setParam("Presolve", presolve)
+    model.setParam("MIPFocus", mip_focus)
+    model.setParam("Method", method)
+    model.setParam("Symmetry", 2)
 
     # Solution pool parameters
     model.setParam("PoolSearchMode", 2)      # search for many solutions (2 = aggressive search)
@@ -38,21 +155,39 @@ def solve_set_covering(LOGDIR: str,
         # Store solutions within `pool_gap` relative gap of best objective (e.g. 0.05 for 5%)
         model.setParam("PoolGap", float(pool_gap))
 
+    # --- Columns -------------------------------------------------------------
+    # Trips covering delivery k are those with bit k of their mask set
+    # (see generate_feasible_trips), which gives the 0/1 covering matrix A.
+    masks = np.fromiter((t.mask for t in trips), np.uint64, count=len(trips))
+    score_vec = np.fromiter((t.score for t in trips), float, count=len(trips))
+    A = build_covering_matrix(masks, len(deliveries))
+    if column_generation:
+        singletons = np.flatnonzero((masks & (masks - np.uint64(1))) == 0)
+        columns = generate_columns(A, score_vec, singletons, threads=threads, method=method)
+    else:
+        columns = np.arange(len(trips))
+
     # --- Variables -----------------------------------------------------------
-    x = {i: model.addVar(vtype=GRB.BINARY, name=f"x_{i}") for i in range(len(trips))}
-    all_vars = list(x.values())
+    n = len(columns)
+    x = model.addMVar(n, vtype=GRB.BINARY, name="x")
 
     # --- Covering constraints ------------------------------------------------
-    delivery_ids = [d.id for d in deliveries]
-    for d_id in delivery_ids:
-        model.addConstr(
-            quicksum(x[i] for i, t in enumerate(trips) if d_id in t["shipment_ids"]) == 1,
-            name=f"cover_{d_id}"
-        )
+    # A x = 1 over the selected columns, added at once
+    cover = model.addMConstr(A[:, columns], x, "=", np.ones(len(deliveries)))
+    model.update()
+    model.setAttr("ConstrName", cover.tolist(), [f"cover_{d.id}" for d in deliveries])
 
     # --- Objective -----------------------------------------------------------
     # Keep same objective (minimize total score)
-    model.setObjective(quicksum(x[i] * trips[i]["score"] for i in x), GRB.MINIMIZE)
+    model.setObjective(score_vec[columns] @ x, GRB.MINIMIZE)
+
+    # --- Warm start ----------------------------------------------------------
+    # Greedy incumbent so that branch-and-bound starts with an upper bound
+    chosen = greedy_cover(masks[columns], score_vec[columns], len(deliveries))
+    if chosen is not None:
+        start = np.zeros(n)
+        start[chosen] = 1.0
+        x.Start = start
 
     # --- Optimize ------------------------------------------------------------
     model.optimize()
@@ -63,6 +198,12 @@ def solve_set_covering(LOGDIR: str,
         return []
 
     # --- Extract solutions from pool ----------------------------------------
+    # Per-column trip metrics, so each pool solution is aggregated with NumPy
+    km_arr = np.fromiter((trips[i].total_km for i in columns), float, count=n)
+    wt_arr = np.fromiter((trips[i].total_weight for i in columns), float, count=n)
+    vol_arr = np.fromiter((trips[i].total_volume for i in columns), float, count=n)
+    sc_arr = score_vec[columns]
+
     solutions = []
     # iterate over pool solutions (0 .. SolCount-1)
     sol_count = model.SolCount
@@ -71,41 +212,35 @@ def solve_set_covering(LOGDIR: str,
         # (SolutionNumber is a parameter that controls which Xn values are returned)
         model.setParam("SolutionNumber", s)
 
-        # Get the variable values for the chosen pool solution:
-        # model.getAttr("Xn", all_vars) returns the list of Xn values for current SolutionNumber.
-        xn_list = model.getAttr("Xn", all_vars)  # list of 0.0/1.0 (or fractional) per var for solution s
-
-        obj_val = model.getAttr("PoolObjVal")
+        # Xn of the whole MVar for the current SolutionNumber, in one call
+        xn = np.asarray(x.Xn)  # 0.0/1.0 (or fractional) per var for solution s
+        obj_val = model.PoolObjVal
 
         # Collect selected trips
-        selected_indices = [i for i, val in enumerate(xn_list) if val > 0.5]
-        selected_trip_dicts = [trips[i] for i in selected_indices]
-
-        # Aggregate some metrics
-        total_km = sum(t["total_km"] for t in selected_trip_dicts)
-        total_weight = sum(t["total_weight"] for t in selected_trip_dicts)
-        total_volume = sum(t["total_volume"] for t in selected_trip_dicts)
-        total_score = sum(t["score"] for t in selected_trip_dicts)
+        idx = np.flatnonzero(xn > 0.5)
+        selected_indices = columns[idx].tolist()
+        selected_trip_list = [trips[i] for i in selected_indices]
 
         solutions.append({
             "solution_number": s,
-            "obj": float(obj_val),
+            "obj": obj_val,
             "selected_trip_indices": selected_indices,
-            "selected_trips": selected_trip_dicts,
-            "total_km": float(total_km),
-            "total_weight": float(total_weight),
-            "total_volume": float(total_volume),
-            "total_score": float(total_score),
+            "selected_trips": selected_trip_list,
+            "total_km": float(km_arr[idx].sum()),
+            "total_weight": float(wt_arr[idx].sum()),
+            "total_volume": float(vol_arr[idx].sum()),
+            "total_score": float(sc_arr[idx].sum()),
         })
 
     print(f"Found {len(solutions)} solution(s) in pool for instance {i_name}.")
     # Sort solutions by objective (lowest first)
     solutions_sorted = sorted(solutions, key=lambda z: z["obj"])
-    with open(os.path.join(LOGDIR, f"{i_name}.log"), "a") as f:
-        f.write(f"Found {len(solutions_sorted)} pool solutions for {i_name} (Time {model.Runtime:.2f}s)\n")
-        for sol in solutions_sorted:
-            f.write(f"Solution #{sol['solution_number']}: obj={sol['obj']:.6f}, "
-                    f"selected_trips={sol['selected_trip_indices']}, total_km={sol['total_km']:.2f}\n")
+    lines = [f"Found {len(solutions_sorted)} pool solutions for {i_name} (Time {model.Runtime:.2f}s, Threads {threads})"]
+    for sol in solutions_sorted:
+        lines.append(f"Solution #{sol['solution_number']}: obj={sol['obj']:.6f}, "
+                     f"selected_trips={sol['selected_trip_indices']}, total_km={sol['total_km']:.2f}")
+    with open(log_path, "a", buffering=1 << 16) as f:
+        f.write("\n".join(lines) + "\n")
 
     # Print brief summary
     for idx, sol in enumerate(solutions_sorted):
@@ -1,7 +1,18 @@
 from utils import *
-from itertools import combinations
-from typing import List, Dict, Set
-import pandas as pd
+from typing import List, Dict, Set, Tuple
+import numpy as np
+
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:  # numba is optional: the kernels below then run as plain Python
+    numba = None
+    prange = range
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
 
 
 MAX_PICKUPS = 3  # max number of pickups allowed in a single trip
@@ -9,115 +20,309 @@ MAX_WAIT_SLOT = 2 # max 2 slots wait time allowed
 MAX_DISTANCE_INCREASE_RATIO = 0.2  # max 20% detour allowed
 
 
-def compute_trip_distance(loc_sequence: List[str], dist_matrix: pd.DataFrame) -> float:
+def set_kernel_threads(threads: int = 0):
     """
-    Compute the total distance of a trip given a sequence of locations.
-    - loc_sequence: ordered list of location IDs/names
-    - dist_matrix: pandas DataFrame with pairwise distances
+    Set the Numba thread count of the trip search kernel. As for Gurobi, 0 means
+    automatic (all Numba threads); other values are clamped to 1..NUMBA_NUM_THREADS.
+    No-op when numba is not installed.
     """
+    if numba is None:
+        return
+    n_max = numba.config.NUMBA_NUM_THREADS
+    numba.set_num_threads(max(1, min(threads or n_max, n_max)))
 
-    dist = 0.0
-    for i in range(len(loc_sequence) - 1):
-        dist += dist_matrix.at[loc_sequence[i], loc_sequence[i + 1]]
-    return dist
 
-
-def max_wait_time(deliveries: List[Delivery]) -> float:
+@njit(cache=True)
+def emit_trip(mask, size, trip_distance, direct_distances, ratio,
+              out_mask, out_size, out_km, out_score, slot, write):
+    """
+        Detour check for a combo whose route (pickups in index order, then the
+        depot) is `trip_distance` long. Returns 1 if the trip is kept, writing
+        it at `slot` when `write` is set, 0 otherwise.
     """
-     Compute the maximum waiting time between deliveries becoming ready.
-     Returns 0.0 if there is only one delivery.
-     """
-    times = sorted(d.goods_ready for d in deliveries)
-    if len(times) < 2:
-        return 0.0
-    waits = [(t2 - t1) for t1, t2 in zip(times, times[1:])]
-    return max(waits)
+    # Check that trip distance is not excessively longer than direct trips
+    if trip_distance > direct_distances * (1 + ratio):
+        return 0
 
+    if write:
+        out_mask[slot] = mask
+        out_size[slot] = size
+        out_km[slot] = trip_distance
+        # A pickup at the depot has no direct distance: no score, as in the baseline
+        out_score[slot] = trip_distance / direct_distances if direct_distances > 0 else np.nan
+    return 1
 
-def check_capacity(deliveries: List[Delivery], max_weight: float, max_volume: float) -> bool:
+
+@njit(cache=True)
+def search_root(i0, W, V, avail_ok, ready, due_hi, type_bits, conflict_bits, pp, direct_km,
+                cap_w, cap_v, max_wait, ratio, max_pickups,
+                out_mask, out_size, out_km, out_score, offset, write):
+    """
+        Iterative depth-first search over the combos whose first (lowest index)
+        delivery is `i0`. Capacity, time window and goods type incompatibilities
+        can only get tighter as a combo grows, so a violation prunes the whole
+        subtree. The waiting time is not monotone (a new pickup may split a
+        long gap), so it only decides whether the combo itself is emitted.
+        Returns the number of trips found; with `write` set they are stored
+        from `offset` on, in depth-first (lexicographic) order.
     """
-        Check whether the deliveries fit within truck capacity (weight & volume).
-        Also checks that each delivery individually does not exceed its
-        available capacity.
-        """
+    n = W.shape[0]
+    if not avail_ok[i0] or W[i0] > cap_w or V[i0] > cap_v or ready[i0] > due_hi[i0]:
+        return 0
+
+    combo = np.empty(max_pickups, np.int64)
+    nxt = np.empty(max_pickups, np.int64)
+    w_lvl = np.empty(max_pickups)
+    v_lvl = np.empty(max_pickups)
+    ready_lvl = np.empty(max_pickups)
+    due_lvl = np.empty(max_pickups)
+    # goods types incompatible with any delivery of combo[:k + 1]
+    forbidden_lvl = np.empty(max_pickups, np.uint64)
+    mask_lvl = np.empty(max_pickups, np.uint64)
+    # Route length from the first to the last pickup (depot leg excluded) and
+    # sum of the direct pickup -> depot distances of combo[:k + 1]
+    path_lvl = np.empty(max_pickups)
+    direct_lvl = np.empty(max_pickups)
+    # sorted_ready[k, :k + 1] holds the sorted ready slots of combo[:k + 1]
+    sorted_ready = np.empty((max_pickups, max_pickups))
+    # largest gap between consecutive entries of sorted_ready[k, :k + 1]
+    gap_lvl = np.empty(max_pickups)
 
-    total_weight = sum(d.weight_kg for d in deliveries)
-    total_volume = sum(d.volume_m3 for d in deliveries)
-    # Check also available weight and volume individually (assuming available_* is capacity left)
-    avail_weight_ok = all(d.available_weight >= d.weight_kg for d in deliveries)
-    avail_volume_ok = all(d.available_volume >= d.volume_m3 for d in deliveries)
-    return total_weight <= max_weight and total_volume <= max_volume and avail_weight_ok and avail_volume_ok
+    combo[0] = i0
+    nxt[0] = i0 + 1
+    w_lvl[0] = W[i0]
+    v_lvl[0] = V[i0]
+    ready_lvl[0] = ready[i0]
+    due_lvl[0] = due_hi[i0]
+    forbidden_lvl[0] = conflict_bits[i0]
+    mask_lvl[0] = np.uint64(1) << np.uint64(i0)
+    path_lvl[0] = 0.0
+    direct_lvl[0] = direct_km[i0]
+    sorted_ready[0, 0] = ready[i0]
+    gap_lvl[0] = 0.0
+    count = emit_trip(mask_lvl[0], 1, path_lvl[0] + direct_km[i0], direct_lvl[0], ratio,
+                      out_mask, out_size, out_km, out_score, offset, write)
 
+    depth = 0
+    while depth >= 0:
+        if depth + 1 >= max_pickups or nxt[depth] >= n:
+            depth -= 1
+            continue
+        j = nxt[depth]
+        nxt[depth] += 1
+        if not avail_ok[j]:
+            continue
+        nw = w_lvl[depth] + W[j]
+        nv = v_lvl[depth] + V[j]
+        if nw > cap_w or nv > cap_v:
+            continue
+        n_ready = max(ready_lvl[depth], ready[j])
+        n_due = min(due_lvl[depth], due_hi[j])
+        if n_ready > n_due:
+            continue
+        if forbidden_lvl[depth] & type_bits[j] != 0:
+            continue
 
-def check_time_window(deliveries: List[Delivery]) -> bool:
+        # Extending the route by one pickup only adds the last -> j leg;
+        # the j -> depot leg is added when the trip is checked.
+        path_lvl[depth + 1] = path_lvl[depth] + pp[combo[depth], j]
+        direct_lvl[depth + 1] = direct_lvl[depth] + direct_km[j]
+        mask_lvl[depth + 1] = mask_lvl[depth] | (np.uint64(1) << np.uint64(j))
+
+        depth += 1
+        combo[depth] = j
+        nxt[depth] = j + 1
+        w_lvl[depth] = nw
+        v_lvl[depth] = nv
+        ready_lvl[depth] = n_ready
+        due_lvl[depth] = n_due
+        forbidden_lvl[depth] = forbidden_lvl[depth - 1] | conflict_bits[j]
+
+        # Sorted insert of ready[j] into the parent's ready slots
+        p = 0
+        while p < depth and sorted_ready[depth - 1, p] <= ready[j]:
+            sorted_ready[depth, p] = sorted_ready[depth - 1, p]
+            p += 1
+        sorted_ready[depth, p] = ready[j]
+        for k in range(p, depth):
+            sorted_ready[depth, k + 1] = sorted_ready[depth - 1, k]
+        # Only the gaps next to position p change: inserting at either end adds
+        # one gap, inserting inside splits the gap (p - 1, p + 1) in two. The
+        # maximum only has to be rescanned when the split gap was the maximum.
+        srt = sorted_ready[depth]
+        max_gap = gap_lvl[depth - 1]
+        if p == 0:
+            max_gap = max(max_gap, srt[1] - srt[0])
+        elif p == depth:
+            max_gap = max(max_gap, srt[depth] - srt[depth - 1])
+        elif srt[p + 1] - srt[p - 1] >= max_gap:
+            max_gap = 0.0
+            for k in range(depth):
+                max_gap = max(max_gap, srt[k + 1] - srt[k])
+        gap_lvl[depth] = max_gap
+
+        if max_gap <= max_wait:
+            count += emit_trip(mask_lvl[depth], depth + 1, path_lvl[depth] + direct_km[j],
+                               direct_lvl[depth], ratio, out_mask, out_size, out_km, out_score, offset + count, write)
+    return count
+
+
+@njit(cache=True, parallel=True)
+def generate_feasible_trips_core(W, V, avail_ok, ready, due_hi, type_bits, conflict_bits, pp, direct_km,
+                                 cap_w, cap_v, max_wait, ratio, max_pickups):
     """
-       Check time-window feasibility:
-       The latest "ready" time among deliveries must be <= earliest due date.
+        Enumerate all feasible trips, in parallel over the first delivery of the
+        trip. A first pass counts the trips of each subtree, a second pass
+        writes them into preallocated arrays at the resulting offsets.
+
+        Returns (mask, size, total_km, score) arrays, one entry per trip; bit k
+        of mask is set when delivery k is part of the trip.
     """
-    latest_ready = max(d.goods_ready for d in deliveries)
-    earliest_due = min(d.delivery_window[1] for d in deliveries)
-    return latest_ready <= earliest_due
+    n = W.shape[0]
+    empty_mask = np.empty(0, np.uint64)
+    empty_size = np.empty(0, np.int64)
+    empty_f8 = np.empty(0)
 
+    counts = np.zeros(n, np.int64)
+    for i0 in prange(n):
+        counts[i0] = search_root(i0, W, V, avail_ok, ready, due_hi, type_bits, conflict_bits, pp, direct_km,
+                                 cap_w, cap_v, max_wait, ratio, max_pickups,
+                                 empty_mask, empty_size, empty_f8, empty_f8, 0, False)
 
+    offsets = np.zeros(n + 1, np.int64)
+    offsets[1:] = np.cumsum(counts)
+    total = offsets[n]
+    out_mask = np.empty(total, np.uint64)
+    out_size = np.empty(total, np.int64)
+    out_km = np.empty(total)
+    out_score = np.empty(total)
+    for i0 in prange(n):
+        search_root(i0, W, V, avail_ok, ready, due_hi, type_bits, conflict_bits, pp, direct_km,
+                    cap_w, cap_v, max_wait, ratio, max_pickups,
+                    out_mask, out_size, out_km, out_score, offsets[i0], True)
+    return out_mask, out_size, out_km, out_score
 
 
 def generate_feasible_trips(deliveries: List[Delivery],
                             capacity_kg: float,
                             capacity_m3: float,
-                            dist_matrix: pd.DataFrame,
-                            incompat_set: Set[tuple]) -> List[Dict]:
+                            dist_matrix: np.ndarray,
+                            loc_to_idx: Dict[str, int],
+                            incompat_set: Set[tuple]) -> List[Trip]:
     """
        Generate all feasible trips by checking:
        - Capacity (weight & volume)
        - Time windows
+       - Goods type incompatibilities
        - Waiting time between pickups
        - Trip distance not excessively longer than direct trips
 
-       Returns a list of dictionaries with trip info.
+       Returns a list of Trip tuples. "mask" encodes the covered deliveries
+       as a bitmask: bit k is set when deliveries[k] is part of the trip.
     """
 
+    n = len(deliveries)
+    if n > 64:
+        raise ValueError(f"At most 64 deliveries per instance are supported, got {n}")
+
+    # Struct-of-arrays view of the deliveries: the search only touches these
+    # numeric fields, one at a time, so keep each one contiguous.
+    arr, lookups = deliveries_to_array(deliveries)
+    W = np.ascontiguousarray(arr["weight_kg"])
+    V = np.ascontiguousarray(arr["volume_m3"])
+    ready = arr["goods_ready"].astype('f8')
+    due_hi = arr["window_end"].astype('f8')
+    # Each delivery must fit its own available capacity; a delivery failing this
+    # can never be part of a trip, so it is checked once for all combos.
+    avail_ok = (arr["available_weight"] >= W) & (arr["available_volume"] >= V)
+    goods = lookups["goods_type"]
+    type_bits, conflict_bits = goods_type_masks([goods[c] for c in arr["goods_type_id"]], incompat_set)
+
+    loc_of_code = np.array([loc_to_idx[p] for p in lookups["pickup_location"]], dtype=np.int64)
+    pidx = loc_of_code[arr["pickup_id"]]
+    # Pickup-to-pickup distances between the deliveries of this instance, as a small
+    # contiguous block indexed by delivery, and each delivery's pickup -> depot distance
+    pp = dist_matrix[np.ix_(pidx, pidx)].astype(np.float64)
+    direct_km = dist_matrix[pidx, loc_to_idx["Mpx"]].astype(np.float64)
+
+    masks, sizes, total_km, scores = generate_feasible_trips_core(
+        W, V, avail_ok, ready, due_hi, type_bits, conflict_bits, pp, direct_km,
+        float(capacity_kg), float(capacity_m3), float(MAX_WAIT_SLOT),
+        float(MAX_DISTANCE_INCREASE_RATIO), MAX_PICKUPS)
+
+    # Depth-first order within each size is the combinations() order, so a stable
+    # sort by size gives singletons first, then pairs, ... as the logs and MIP expect.
+    # Each delivery set is emitted once by the search (pickups are visited in index
+    # order); the seen set keeps it that way should the route order ever be explored.
     feasible_trips = []
-    for r in range(1, MAX_PICKUPS + 1):
-        for combo in combinations(deliveries, r):
-            if not check_capacity(combo, capacity_kg, capacity_m3):
-                continue
-            if not check_time_window(combo):
-                continue
-            # goods_types = [d.goods_type for d in combo]
-            # if not check_incompatibility(goods_types, incompat_set):
-            #    continue
-            if max_wait_time(combo) > MAX_WAIT_SLOT:
-                continue
-
-            loc_sequence = [d.pickup_location for d in combo] + ["Mpx"]
-            trip_distance = compute_trip_distance(loc_sequence, dist_matrix)
-
-            # Check that trip distance is not excessively longer than direct trips
-            direct_distances = sum(compute_trip_distance([d.pickup_location, "Mpx"], dist_matrix) for d in combo)
-            if trip_distance > direct_distances * (1 + MAX_DISTANCE_INCREASE_RATIO):
-                continue
-
-            score = trip_distance / direct_distances
-            feasible_trips.append({
-                "source": combo[0].id,
-                "shipment_ids": [d.id for d in combo],
-                "total_km": float(trip_distance),
-                "total_weight": sum(d.weight_kg for d in combo),
-                "total_volume": sum(d.volume_m3 for d in combo),
-                "score": float(score)
-            })
+    seen: Set[int] = set()
+    for t in np.argsort(sizes, kind="stable"):
+        mask = int(masks[t])
+        if mask in seen:
+            continue
+        seen.add(mask)
+        combo = [k for k in range(n) if mask >> k & 1]
+        feasible_trips.append(Trip(
+            source=deliveries[combo[0]].id,
+            shipment_ids=[deliveries[k].id for k in combo],
+            total_km=float(total_km[t]),
+            total_weight=float(sum(W[k] for k in combo)),
+            total_volume=float(sum(V[k] for k in combo)),
+            score=float(scores[t]),
+            mask=mask
+        ))
 
     return feasible_trips
 
 
+def filter_dominated_trips(trips: List[Trip]) -> List[Trip]:
+    """
+        Keep only the lowest-score trip for each covered set of deliveries
+        (same mask); ties keep the first one. Trips keep their relative order.
+        A trip covering a strict subset of another one is not dropped: the
+        covering constraints are equalities, so the smaller trip may be needed.
+    """
+
+    best_by_mask: Dict[int, int] = {}
+    for i, t in enumerate(trips):
+        best = best_by_mask.get(t.mask)
+        if best is None or trips[best].score > t.score:
+            best_by_mask[t.mask] = i
+    keep = sorted(best_by_mask.values())
+    return [trips[i] for i in keep]
+
+
+def goods_type_masks(goods_types: List[str], incompat_set: Set[tuple]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Bit encoding of goods types for the incompatibility check: each distinct
+        type gets one bit. For each entry of goods_types returns its type bit
+        and the bits of all the types it is incompatible with.
+        Incompatibility is symmetric: (A,B) or (B,A) means conflict.
+    """
+
+    codes = {g: i for i, g in enumerate(dict.fromkeys(goods_types))}
+    if len(codes) > 64:
+        raise ValueError(f"At most 64 goods types are supported, got {len(codes)}")
+    conflict = [0] * len(codes)
+    for g1, g2 in incompat_set:
+        if g1 in codes and g2 in codes:
+            conflict[codes[g1]] |= 1 << codes[g2]
+            conflict[codes[g2]] |= 1 << codes[g1]
+    type_bits = np.array([1 << codes[g] for g in goods_types], dtype=np.uint64)
+    conflict_bits = np.array([conflict[codes[g]] for g in goods_types], dtype=np.uint64)
+    return type_bits, conflict_bits
+
+
 def check_incompatibility(goods_types: List[str], incompat_set: Set[tuple]) -> bool:
     """
         Check that no pair of goods types in the list are incompatible.
         Incompatibility is symmetric: (A,B) or (B,A) means conflict.
     """
 
-    for i, g1 in enumerate(goods_types):
-        for g2 in goods_types[i + 1:]:
-            if (g1, g2) in incompat_set or (g2, g1) in incompat_set:
-                return False
+    type_bits, conflict_bits = goods_type_masks(goods_types, incompat_set)
+    forbidden = 0
+    for bit, conflict in zip(type_bits.tolist(), conflict_bits.tolist()):
+        if forbidden & bit:
+            return False
+        forbidden |= conflict
     return True
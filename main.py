@@ -1,7 +1,8 @@
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 from utils import generate_instances, read_instance_files
-from Trip_generation import generate_feasible_trips
+from Trip_generation import generate_feasible_trips, filter_dominated_trips, set_kernel_threads
 from Set_covering import solve_set_covering
 from collections import namedtuple
 
@@ -11,6 +12,7 @@ Delivery = namedtuple('Delivery',
 
 NUM_TRANSPORTERS = 10
 MAX_PICKUPS = 3
+NPROC = max(1, (os.cpu_count() or 2) // 2)  # worker processes, one instance each
 
 i_dir = "Test"
 LOGDIR = os.path.join("Output", i_dir, "Logs")
@@ -21,6 +23,82 @@ os.makedirs(SOLDIR, exist_ok=True)
 os.makedirs(LOGDIR, exist_ok=True)
 os.makedirs(INSDIR, exist_ok=True)
 
+
+def process_instance(idx, deliveries, dist_matrix, loc_to_idx, incompat_set, capacity_kg, capacity_m3, threads=1):
+    """
+    Full pipeline for one instance: trip generation, set covering, .sol files and log.
+    Instances are independent, so this runs in a worker process; `threads` is
+    the Gurobi and Numba thread count of the worker (1 avoids oversubscribing the cores).
+    """
+    set_kernel_threads(threads)
+    i_name = f"instance_{idx}"
+    start_time = time.time()
+
+    # Generate feasible trips
+    feasible_trips = generate_feasible_trips(
+        deliveries=deliveries,
+        capacity_kg=capacity_kg,
+        capacity_m3=capacity_m3,
+        dist_matrix=dist_matrix,
+        loc_to_idx=loc_to_idx,
+        incompat_set=incompat_set
+    )
+    # Drop trips covering the same deliveries as a cheaper one before the MIP
+    feasible_trips = filter_dominated_trips(feasible_trips)
+    # write feasible trips to a log file
+    # (the log is reopened in append mode later: Gurobi appends to it during the solve)
+    log_path = os.path.join(LOGDIR, f"{i_name}.log")
+    trip_lines = [f"Feasible trips for {i_name}:"]
+    for trip in feasible_trips:
+        trip_lines.append(f"Source: {trip.source}, total_km: {trip.total_km:.2f}, "
+                          f"total_weight: {trip.total_weight:.2f}, "
+                          f"total_volume: {trip.total_volume:.2f}, score: {trip.score:.2f}")
+        trip_lines.append(f"Deliveries: {', '.join(trip.shipment_ids)}\n")
+    with open(log_path, "w", buffering=1 << 20) as f:
+        f.write("\n".join(trip_lines) + "\n")
+    print(f"Generated {len(feasible_trips)} feasible trips for {i_name}")
+
+    # print the matrix of feasible trips
+    print("Feasible trips matrix:")
+    for trip in feasible_trips:
+        print(f"Source: {trip.source}, Total KM: {trip.total_km:.2f}, "
+              f"Weight: {trip.total_weight:.2f}, Volume: {trip.total_volume:.2f}, "
+              f"score: {trip.score:.2f}, Deliveries: {', '.join(trip.shipment_ids)}")
+
+    # Solve set covering
+    solutions = solve_set_covering(LOGDIR, i_name, feasible_trips, deliveries, threads=threads)
+
+    elapsed = time.time() - start_time
+
+    for sol in solutions:
+        solnum = sol["solution_number"]
+        sol_lines = [f"# Solution {solnum} for {i_name}",
+                     f"# Objective value: {sol['obj']:.6f}",
+                     f"# Number of deliveries: {len(deliveries)}",
+                     f"# Number of feasible trips generated: {len(feasible_trips)}",
+                     f"# Number of trips selected: {len(sol['selected_trip_indices'])}\n"]
+        for t in sol["selected_trips"]:
+            sol_lines.append(f"Source: {t.source}, total_km: {t.total_km:.2f}, "
+                             f"weight: {t.total_weight:.2f}, volume: {t.total_volume:.2f}, "
+                             f"score: {t.score:.2f}")
+            sol_lines.append(f"Deliveries: {', '.join(t.shipment_ids)}\n")
+        with open(os.path.join(SOLDIR, f"{i_name}_sol{solnum}.sol"), "w") as fsol:
+            fsol.write("\n".join(sol_lines) + "\n")
+
+    # --- Append to one master log file ------------------------------------------
+    lines = [f"\n=== Summary for {i_name} ===",
+             f"Deliveries count: {len(deliveries)}",
+             f"Feasible trips generated: {len(feasible_trips)}",
+             f"Solutions in pool: {len(solutions)}"]
+    for sol in solutions:
+        lines.append(f"Solution {sol['solution_number']} | "
+                     f"obj={sol['obj']:.6f}, "
+                     f"trips={len(sol['selected_trip_indices'])}, "
+                     f"total_km={sol['total_km']:.2f}")
+    with open(log_path, "a", buffering=1 << 16) as flog:
+        flog.write("\n".join(lines) + "\n")
+
+
 if __name__ == "__main__":
     generate_instances(
         num_instances=10, i_name=i_dir,
@@ -36,71 +114,16 @@ if __name__ == "__main__":
         delivery_window_min=30,
         delivery_window_duration_min=60)
 
-    deliveries_list, dist_df, incompat_set = read_instance_files(INSDIR)
+    deliveries_list, dist_matrix, loc_to_idx, incompat_set = read_instance_files(INSDIR)
     print(f"Loaded {len(deliveries_list)} instances")
 
-    for idx, deliveries in enumerate(deliveries_list):
-        i_name = f"instance_{idx}"
-        start_time = time.time()
-
-        # Transporter info
-        capacity_kg = 4000
-        capacity_m3 = 15.0
-
-        # Generate feasible trips
-        feasible_trips = generate_feasible_trips(
-            deliveries=deliveries,
-            capacity_kg=capacity_kg,
-            capacity_m3=capacity_m3,
-            dist_matrix=dist_df,
-            incompat_set=incompat_set
-        )
-        # write feasible trips to a log file
-        with open(os.path.join(LOGDIR, f"{i_name}.log"), "w") as f:
-            f.write(f"Feasible trips for {i_name}:\n")
-            for trip in feasible_trips:
-                f.write(f"Source: {trip['source']}, total_km: {trip['total_km']:.2f}, "
-                        f"total_weight: {trip['total_weight']:.2f}, "
-                        f"total_volume: {trip['total_volume']:.2f}, score: {trip['score']:.2f}\n")
-                f.write(f"Deliveries: {', '.join(trip['shipment_ids'])}\n\n")
-        print(f"Generated {len(feasible_trips)} feasible trips for {i_name}")
-
-        # print the matrix of feasible trips
-        print("Feasible trips matrix:")
-        for trip in feasible_trips:
-            print(f"Source: {trip['source']}, Total KM: {trip['total_km']:.2f}, "
-                  f"Weight: {trip['total_weight']:.2f}, Volume: {trip['total_volume']:.2f}, "
-                  f"score: {trip['score']:.2f}, Deliveries: {', '.join(trip['shipment_ids'])}")
-
-        # Solve set covering
-        solutions = solve_set_covering(LOGDIR, i_name, feasible_trips, deliveries)
-
-        elapsed = time.time() - start_time
-
-        for sol in solutions:
-            solnum = sol["solution_number"]
-            sol_filename = os.path.join(SOLDIR, f"{i_name}_sol{solnum}.sol")
-            with open(sol_filename, "w") as fsol:
-                fsol.write(f"# Solution {solnum} for {i_name}\n")
-                fsol.write(f"# Objective value: {sol['obj']:.6f}\n")
-                fsol.write(f"# Number of deliveries: {len(deliveries)}\n")
-                fsol.write(f"# Number of feasible trips generated: {len(feasible_trips)}\n")
-                fsol.write(f"# Number of trips selected: {len(sol['selected_trip_indices'])}\n\n")
-                for t in sol["selected_trips"]:
-                    fsol.write(f"Source: {t['source']}, total_km: {t['total_km']:.2f}, "
-                               f"weight: {t['total_weight']:.2f}, volume: {t['total_volume']:.2f}, "
-                               f"score: {t['score']:.2f}\n")
-                    fsol.write(f"Deliveries: {', '.join(t['shipment_ids'])}\n\n")
-
-        # --- Append to one master log file ------------------------------------------
-        log_filename = os.path.join(LOGDIR, f"{i_name}.log")
-        with open(log_filename, "a") as flog:
-            flog.write(f"\n=== Summary for {i_name} ===\n")
-            flog.write(f"Deliveries count: {len(deliveries)}\n")
-            flog.write(f"Feasible trips generated: {len(feasible_trips)}\n")
-            flog.write(f"Solutions in pool: {len(solutions)}\n")
-            for sol in solutions:
-                flog.write(f"Solution {sol['solution_number']} | "
-                           f"obj={sol['obj']:.6f}, "
-                           f"trips={len(sol['selected_trip_indices'])}, "
-                           f"total_km={sol['total_km']:.2f}\n")
\ No newline at end of file
+    # Transporter info
+    capacity_kg = 4000
+    capacity_m3 = 15.0
+
+    with ProcessPoolExecutor(max_workers=NPROC) as executor:
+        futures = [executor.submit(process_instance, idx, deliveries, dist_matrix, loc_to_idx, incompat_set,
+                                   capacity_kg, capacity_m3)
+                   for idx, deliveries in enumerate(deliveries_list)]
+        for future in futures:
+            future.result()
\ No newline at end of file
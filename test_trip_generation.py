@@ -0,0 +1,30 @@
+import math
+import unittest
+
+import numpy as np
+
+from utils import Delivery
+from Trip_generation import generate_feasible_trips
+
+
+class DepotPickupTest(unittest.TestCase):
+    """A pickup at the depot has zero direct distance: its trip gets a nan score."""
+
+    def test_depot_pickup(self):
+        loc_to_idx = {"Mpx": 0, "A": 1}
+        dist = np.array([[0, 20], [20, 0]], dtype=np.int16)
+        deliveries = [
+            Delivery("D0", "Pharma", 100.0, 1.0, 32, (33, 40), "GHA1", "Mpx", 100.0, 1.0, []),
+            Delivery("D1", "Pharma", 100.0, 1.0, 32, (33, 40), "GHA1", "A", 100.0, 1.0, []),
+        ]
+        trips = {t.source: t for t in generate_feasible_trips(deliveries, 4000, 15.0, dist, loc_to_idx, set())}
+
+        self.assertEqual(sorted(trips), ["D0", "D1"])
+        self.assertEqual(trips["D0"].total_km, 0.0)
+        self.assertTrue(math.isnan(trips["D0"].score))
+        self.assertEqual(trips["D1"].total_km, 20.0)
+        self.assertEqual(trips["D1"].score, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
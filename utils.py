@@ -1,16 +1,143 @@
 import os
-import random
 import pandas as pd
 import numpy as np
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+
+try:
+    import numexpr as ne
+except ImportError:  # numexpr is optional: slot arithmetic then runs in plain NumPy
+    ne = None
+
+# Below this many deliveries in total the NumPy expressions are cheaper than numexpr's setup
+NUMEXPR_MIN_SIZE = 100_000
 
 Delivery = namedtuple('Delivery',
                       'id goods_type weight_kg volume_m3 goods_ready delivery_window gha pickup_location '
                       'available_weight available_volume loaded_goods_ids')
 
+# Feasible trip: shipment_ids in pickup order (source is the first one); bit k of
+# mask is set when the k-th delivery of the instance is part of the trip
+Trip = namedtuple('Trip', 'source shipment_ids total_km total_weight total_volume score mask')
+
+# Column types of the instance files: generated instances are written in these
+# types, and read_csv parses straight into them.
+# The available capacity is not stored: a generated delivery is fully loaded
+# (available_weight == weight_kg, available_volume == volume_m3), so it is
+# rebuilt from the base fields on read.
+INSTANCE_DTYPES = {
+    "id": "string",
+    "goods_type": "category",
+    "weight_kg": "float64",
+    "volume_m3": "float64",
+    "goods_ready_slot": "int32",
+    "window_start_slot": "int32",
+    "window_end_slot": "int32",
+    "gha": "category",
+    "pickup_location": "category",
+    "loaded_goods_ids": "string",
+}
+
+# Numeric fields of a delivery, packed one record per delivery; the string fields
+# are stored as codes into the lookup tables returned by deliveries_to_array
+DELIVERY_DTYPE = np.dtype([
+    ('weight_kg', 'f8'),
+    ('volume_m3', 'f8'),
+    ('goods_ready', 'i4'),
+    ('window_start', 'i4'),
+    ('window_end', 'i4'),
+    ('gha_id', 'i2'),
+    ('pickup_id', 'i2'),
+    ('goods_type_id', 'i2'),
+    ('available_weight', 'f8'),
+    ('available_volume', 'f8'),
+])
+
+def deliveries_to_array(deliveries):
+    """
+    Pack a list of Delivery tuples into a DELIVERY_DTYPE structured array.
+
+    Returns:
+        tuple: (array, lookups) where lookups maps "gha", "pickup_location" and
+        "goods_type" to the list of distinct values, in order of first appearance,
+        indexed by the matching *_id field.
+    """
+    arr = np.empty(len(deliveries), dtype=DELIVERY_DTYPE)
+    lookups = {}
+    for field, key in (("gha_id", "gha"), ("pickup_id", "pickup_location"),
+                       ("goods_type_id", "goods_type")):
+        values = [getattr(d, key) for d in deliveries]
+        codes = {v: c for c, v in enumerate(dict.fromkeys(values))}
+        arr[field] = [codes[v] for v in values]
+        lookups[key] = list(codes)
+    arr["weight_kg"] = [d.weight_kg for d in deliveries]
+    arr["volume_m3"] = [d.volume_m3 for d in deliveries]
+    arr["goods_ready"] = [d.goods_ready for d in deliveries]
+    arr["window_start"] = [d.delivery_window[0] for d in deliveries]
+    arr["window_end"] = [d.delivery_window[1] for d in deliveries]
+    arr["available_weight"] = [d.available_weight for d in deliveries]
+    arr["available_volume"] = [d.available_volume for d in deliveries]
+    return arr, lookups
+
 def time_to_slot(minutes: int, slot_duration: int) -> int:
     return minutes // slot_duration
 
+def slot_fields(base_min, ready_off, win_off, slot_duration: int, window_slots: int):
+    """
+    Ready, window start and window end slots of deliveries whose goods are ready
+    ready_off minutes after base_min, with the window opening win_off minutes later.
+    Large arrays are evaluated with numexpr when it is installed.
+    """
+    if ne is not None and ready_off.size > NUMEXPR_MIN_SIZE:
+        env = {"b": base_min, "r": ready_off, "w": win_off, "s": slot_duration, "l": window_slots}
+        ready_slot = ne.evaluate("(b + r) // s", local_dict=env)
+        window_start_slot = ne.evaluate("(b + r + w) // s", local_dict=env)
+        window_end_slot = ne.evaluate("(b + r + w) // s + l", local_dict=env)
+    else:
+        ready_min = base_min + ready_off
+        ready_slot = ready_min // slot_duration
+        window_start_slot = (ready_min + win_off) // slot_duration
+        window_end_slot = window_start_slot + window_slots
+    return ready_slot, window_start_slot, window_end_slot
+
+def generate_instance_frame(inst_id: int, child_seed, params: dict):
+    """
+    Draw all deliveries of one instance at once from its own seed.
+    Runs in a worker process: params carries the generation bounds and the string
+    tables of the categorical fields, whose integer codes are drawn.
+
+    Returns:
+        tuple: (frame, ready_off, win_off); the slot columns are computed by the
+        caller from the two offset arrays, over all instances together.
+    """
+    rng = np.random.default_rng(child_seed)
+    N = params["deliveries_per_instance"]
+    ready_off = rng.integers(0, params["max_ready_offset_min"] + 1, N)
+    win_off = rng.integers(params["delivery_window_min"], params["delivery_window_min"] + 61, N)
+    weights = rng.integers(params["min_weight"], params["max_weight"] + 1, N)
+    volumes = np.round(rng.uniform(params["min_volume"], params["max_volume"], N), 2)
+    goods_type_names = params["goods_type_names"]
+    location_names = params["location_names"]
+    gha_names = params["gha_names"]
+    gtypes = goods_type_names[rng.integers(0, len(goods_type_names), N)]
+    pickups = location_names[rng.integers(0, len(location_names), N)]
+    ghas = gha_names[rng.integers(0, len(gha_names), N)]
+
+    # Columns straight from the drawn arrays
+    frame = pd.DataFrame({
+        "inst_id": np.full(N, inst_id, dtype=np.int32),
+        "id": [f"D{i}" for i in range(N)],
+        "goods_type": gtypes,
+        "weight_kg": weights,
+        "volume_m3": volumes,
+        "gha": ghas,
+        "pickup_location": pickups,
+        "loaded_goods_ids": [""] * N
+    })
+    return frame, ready_off, win_off
+
 def generate_instances(num_instances: int, i_name: str,
                        goods_types: list,
                        locations: list,
@@ -24,21 +151,24 @@ def generate_instances(num_instances: int, i_name: str,
                        delivery_window_min: int,
                        delivery_window_duration_min: int,
                        seed: int = 12345,
-                       slot_duration: int = 15):
+                       slot_duration: int = 15,
+                       max_workers: int = None):
     """
     Generate delivery instances with discretized time fields.
     Time is represented in integer slots of `slot_duration` minutes.
+    Instances are drawn in parallel by up to `max_workers` processes
+    (default: one per CPU), each from its own seed.
 
-    Output:
-      - Instances/*.csv (1 per instance)
-      - Instances/distance_matrix.csv
-      - Instances/incompatibility_pairs.csv
+    Output (parquet, pyarrow engine):
+      - Instances/<i_name>/instances.parquet (all instances, keyed by inst_id)
+      - Instances/<i_name>/distance_matrix.parquet
     """
 
-    random.seed(seed)
-    np.random.seed(seed)
+    # One independent PCG64 substream for the distance matrix and one per instance
+    child_seeds = np.random.SeedSequence(seed).spawn(num_instances + 1)
+    rng_dist = np.random.default_rng(child_seeds[0])
 
-    os.makedirs("Instances", exist_ok=True)
+    os.makedirs(os.path.join("Instances", i_name), exist_ok=True)
 
     # Incompatibilities
     # all_pairs = [(a, b) for i, a in enumerate(goods_types) for b in goods_types[i+1:]]
@@ -48,116 +178,156 @@ def generate_instances(num_instances: int, i_name: str,
     # Distance matrix
     locs = locations + ["Mpx"] if "Mpx" not in locations else locations
     n_loc = len(locs)
-    dist_matrix = np.zeros((n_loc, n_loc), dtype=int)
-    for i in range(n_loc):
-        for j in range(i+1, n_loc):
-            dist = random.randint(10, 100)
-            dist_matrix[i, j] = dist
-            dist_matrix[j, i] = dist
+    # Symmetric with zero diagonal: draw the whole matrix at once, keep the strict
+    # upper triangle and mirror it. Distances are at most 100 km, so int16 is
+    # plenty and parquet keeps the narrow type on disk.
+    R = rng_dist.integers(10, 101, size=(n_loc, n_loc), dtype=np.int32)
+    U = np.triu(R, k=1)
+    dist_matrix = (U + U.T).astype(np.int16)
     dist_df = pd.DataFrame(dist_matrix, index=locs, columns=locs)
-    dist_df.to_csv(f"Instances/{i_name}/distance_matrix.csv")
+    dist_df.to_parquet(f"Instances/{i_name}/distance_matrix.parquet", engine="pyarrow")
 
     # Save incompatibility pairs
     #incompat_df = pd.DataFrame(list(incompatibility_pairs), columns=["GoodsType1", "GoodsType2"])
     #incompat_df.to_csv("Instances/incompatibility_pairs.csv", index=False)
 
-    for inst_id in range(num_instances):
-        deliveries = []
-        total_weight = 0
-        total_volume = 0
-
-        for i in range(deliveries_per_instance):
-            # Base: 8:00 → slot = 32 (8*60 / slot_duration)
-            ready_offset_min = random.randint(0, max_ready_offset_min)
-            window_offset_min = random.randint(delivery_window_min, delivery_window_min + 60)
-            window_duration_min = delivery_window_duration_min
-
-            ready_slot = time_to_slot(8*60 + ready_offset_min, slot_duration)
-            window_start_slot = time_to_slot(8*60 + ready_offset_min + window_offset_min, slot_duration)
-            window_end_slot = window_start_slot + time_to_slot(window_duration_min, slot_duration)
-
-            weight = random.randint(min_weight, max_weight)
-            volume = round(random.uniform(min_volume, max_volume), 2)
-
-            total_weight += weight
-            total_volume += volume
-
-            deliveries.append(Delivery(
-                id=f"D{i}",
-                goods_type=random.choice(goods_types),
-                weight_kg=weight,
-                volume_m3=volume,
-                goods_ready=ready_slot,
-                delivery_window=(window_start_slot, window_end_slot),
-                gha=f"GHA{random.randint(1, max_gha)}",
-                pickup_location=random.choice(locations),
-                available_weight=weight,
-                available_volume=volume,
-                loaded_goods_ids=[]
-            ))
-
-        df_del = pd.DataFrame([{
-            "id": d.id,
-            "goods_type": d.goods_type,
-            "weight_kg": d.weight_kg,
-            "volume_m3": d.volume_m3,
-            "goods_ready_slot": d.goods_ready,
-            "window_start_slot": d.delivery_window[0],
-            "window_end_slot": d.delivery_window[1],
-            "gha": d.gha,
-            "pickup_location": d.pickup_location,
-            "available_weight": d.available_weight,
-            "available_volume": d.available_volume,
-            "loaded_goods_ids": ",".join(d.loaded_goods_ids)
-        } for d in deliveries])
-
-        filename = f"Instances/{i_name}/Instance_{inst_id}.csv"
-        df_del.to_csv(filename, index=False)
-        print(f"Saved instance {inst_id+1}/{num_instances} to {filename}")
+    # Base: 8:00 → slot = 32 (8*60 / slot_duration); the window length in slots
+    # is the same for every delivery
+    base_min = 8*60
+    window_slots = time_to_slot(delivery_window_duration_min, slot_duration)
+    # String tables of the categorical fields: the draws are integer codes into these
+    params = {
+        "deliveries_per_instance": deliveries_per_instance,
+        "max_ready_offset_min": max_ready_offset_min,
+        "delivery_window_min": delivery_window_min,
+        "min_weight": min_weight,
+        "max_weight": max_weight,
+        "min_volume": min_volume,
+        "max_volume": max_volume,
+        "goods_type_names": np.asarray(goods_types),
+        "location_names": np.asarray(locations),
+        "gha_names": np.array([f"GHA{k}" for k in range(1, max_gha + 1)]),
+    }
+
+    frames, ready_offs, win_offs = [], [], []
+    # Progress is reported about a hundred times at most, not once per instance
+    report_every = max(1, num_instances // 100)
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Results come back in instance order; the parent writes them all at once
+        results = executor.map(generate_instance_frame, range(num_instances), child_seeds[1:],
+                               repeat(params), chunksize=max(1, num_instances // (4 * workers)))
+        for inst_id, (frame, ready_off, win_off) in enumerate(results):
+            frames.append(frame)
+            ready_offs.append(ready_off)
+            win_offs.append(win_off)
+            if (inst_id + 1) % report_every == 0 or inst_id + 1 == num_instances:
+                print(f"Generated instance {inst_id+1}/{num_instances}")
+
+    # One file for all instances: a single encode pass and a single write
+    df_del = pd.concat(frames, ignore_index=True)
+    slots = slot_fields(base_min, np.concatenate(ready_offs), np.concatenate(win_offs),
+                        slot_duration, window_slots)
+    pos = df_del.columns.get_loc("volume_m3") + 1
+    for k, (col, values) in enumerate(zip(("goods_ready_slot", "window_start_slot", "window_end_slot"), slots)):
+        df_del.insert(pos + k, col, values)
+    # Stored in the declared column types, so parquet and CSV reads agree
+    df_del = df_del.astype(INSTANCE_DTYPES)
+    filename = f"Instances/{i_name}/instances.parquet"
+    df_del.to_parquet(filename, engine="pyarrow", compression="snappy", index=False)
+    print(f"Saved {num_instances} instances to {filename}")
+
+
+def deliveries_from_frame(df):
+    """
+    Build the Delivery tuples of one instance from its DataFrame: one NumPy
+    array per column, zipped together. The available capacity is the full
+    weight and volume of the delivery.
+    """
+    weights = df["weight_kg"].to_numpy()
+    volumes = df["volume_m3"].to_numpy()
+    # One vectorized split of the whole column; an empty field means nothing loaded
+    loaded = df["loaded_goods_ids"].fillna("").astype("string").str.split(",").tolist()
+    loaded = [[] if ids == [""] else ids for ids in loaded]
+    return [
+        Delivery(i, g, w, v, r, (ws, we), gh, p, w, v, lg)
+        for i, g, w, v, r, ws, we, gh, p, lg in zip(
+            df["id"].to_numpy(), df["goods_type"].to_numpy(), weights, volumes,
+            df["goods_ready_slot"].to_numpy(),
+            df["window_start_slot"].to_numpy(), df["window_end_slot"].to_numpy(),
+            df["gha"].to_numpy(), df["pickup_location"].to_numpy(),
+            loaded)
+    ]
+
+
+@lru_cache(maxsize=8)
+def load_distance_matrix(path: str, mtime: float) -> pd.DataFrame:
+    """
+    Read a distance matrix file (parquet or CSV). Cached per absolute path and
+    modification time, so repeated reads of an unchanged folder skip the parse;
+    the returned DataFrame is shared and must not be modified.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, index_col=0)
 
 
 def read_instance_files(instances_folder):
     """
-    Read all instance CSVs, distance matrix and incompatibility pairs from folder,
+    Read all instance files, distance matrix and incompatibility pairs from folder,
     using discretized time (minutes from midnight as integers).
+    Instances are read from the single instances.parquet file, grouped by inst_id;
+    folders written before the switch to it hold one Instance_* file per instance
+    (parquet or, older still, CSV) and are read file by file.
 
     Args:
-        instances_folder: folder path containing CSV files.
+        instances_folder: folder path containing parquet or CSV files.
 
     Returns:
-        tuple: (list_of_deliveries_lists, distance_df, incompatibility_set)
+        tuple: (list_of_deliveries_lists, distance_matrix, loc_to_idx, incompatibility_set)
+        where distance_matrix is a dense array, in the dtype stored in the file
+        (int16 for generated instances), indexed by the location codes of
+        loc_to_idx (location name -> row/column index).
     """
     deliveries_list = []
     incompatibility_set = set()
-    for file in sorted(os.listdir(instances_folder)):
-        if file.startswith("Instance_") and file.endswith(".csv"):
-            path = os.path.join(instances_folder, file)
-            df = pd.read_csv(path)
-
-            df.columns = [col.strip().lower() for col in df.columns]
-
-            deliveries = []
-            for _, row in df.iterrows():
-                deliveries.append(Delivery(
-                    id=row['id'],
-                    goods_type=row['goods_type'],
-                    weight_kg=float(row['weight_kg']),
-                    volume_m3=float(row['volume_m3']),
-                    goods_ready=int(row['goods_ready_slot']),
-                    delivery_window=(int(row['window_start_slot']), int(row['window_end_slot'])),
-                    gha=row['gha'],
-                    pickup_location=row['pickup_location'],
-                    available_weight=float(row['available_weight']),
-                    available_volume=float(row['available_volume']),
-                    loaded_goods_ids=row['loaded_goods_ids'].split(',') if isinstance(row['loaded_goods_ids'], str) and row['loaded_goods_ids'] else []
-                ))
-            deliveries_list.append(deliveries)
-
-    dist_df = pd.read_csv(os.path.join(instances_folder, "distance_matrix.csv"), index_col=0)
+    combined = os.path.join(instances_folder, "instances.parquet")
+    if os.path.exists(combined):
+        use_parquet = True
+        df = pd.read_parquet(combined, columns=["inst_id"] + list(INSTANCE_DTYPES))
+        for _, df_inst in df.groupby("inst_id", sort=True):
+            deliveries_list.append(deliveries_from_frame(df_inst))
+    else:
+        entries = [e for e in os.scandir(instances_folder)
+                   if e.name.startswith("Instance_") and e.name.endswith((".parquet", ".csv"))]
+        use_parquet = any(e.name.endswith(".parquet") for e in entries)
+        ext = ".parquet" if use_parquet else ".csv"
+        # Numeric order of the instance ids, so that Instance_10 comes after Instance_9
+        entries = sorted((e for e in entries if e.name.endswith(ext)),
+                         key=lambda e: int(e.name[len("Instance_"):-len(ext)]))
+        for entry in entries:
+            if use_parquet:
+                df = pd.read_parquet(entry.path, columns=list(INSTANCE_DTYPES))
+            else:
+                # Header names are matched case- and whitespace-insensitively
+                header = pd.read_csv(entry.path, nrows=0).columns
+                names = {col: col.strip().lower() for col in header
+                         if col.strip().lower() in INSTANCE_DTYPES}
+                df = pd.read_csv(entry.path, usecols=list(names), engine="c",
+                                 dtype={col: INSTANCE_DTYPES[name] for col, name in names.items()})
+                df = df.rename(columns=names)
+            deliveries_list.append(deliveries_from_frame(df))
+
+    dist_path = os.path.abspath(os.path.join(
+        instances_folder, "distance_matrix.parquet" if use_parquet else "distance_matrix.csv"))
+    dist_df = load_distance_matrix(dist_path, os.path.getmtime(dist_path))
+    loc_to_idx = {name: i for i, name in enumerate(dist_df.index)}
+    # A copy: the cached frame is shared by every read of this folder
+    dist_np = dist_df.to_numpy(copy=True)
     #incompat_df = pd.read_csv(os.path.join(instances_folder, "incompatibility_pairs.csv"))
     #incompatibility_set = set(zip(incompat_df["GoodsType1"], incompat_df["GoodsType2"]))
 
-    return deliveries_list, dist_df, incompatibility_set
+    return deliveries_list, dist_np, loc_to_idx, incompatibility_set
 
 
 